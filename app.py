@@ -1,18 +1,61 @@
-from flask import Flask, request, jsonify, send_file, redirect
+from flask import (
+    Flask,
+    Response,
+    after_this_request,
+    request,
+    jsonify,
+    send_file,
+    redirect,
+    stream_with_context,
+)
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 from flask_swagger_ui import get_swaggerui_blueprint
-from googleapiclient.discovery import build
-from googleapiclient.errors import HttpError
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import requests
+import orjson
 import yt_dlp
+from yt_dlp.networking.impersonate import ImpersonateTarget
+from cachetools import TTLCache
+from concurrent.futures import Future, ThreadPoolExecutor
+import fcntl
+import functools
+import hashlib
+import itertools
 import os
-import uuid
+import queue
+import subprocess
+import tempfile
+import threading
+import time
+import unicodedata
 import logging
-import random
-import isodate
 import re
-from werkzeug.exceptions import BadRequest
+import secrets
+from urllib.parse import quote
+from werkzeug.exceptions import BadRequest, RequestedRangeNotSatisfiable
+from werkzeug.http import dump_options_header
+from werkzeug.wsgi import FileWrapper, wrap_file
+
+# JSON provider that serializes with orjson, a C encoder several times faster
+# than the standard library's, for jsonify() and every other JSON response
+class OrjsonProvider(DefaultJSONProvider):
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(
+            orjson.dumps(obj, default=self.default), mimetype=self.mimetype
+        )
+
 
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
 # Enable CORS for all routes
 CORS(app)
 app.config["DOWNLOAD_FOLDER"] = "downloads"
@@ -20,20 +63,57 @@ app.config["DOWNLOAD_FOLDER"] = "downloads"
 # Ensure download directory exists
 os.makedirs(app.config["DOWNLOAD_FOLDER"], exist_ok=True)
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+# Configure logging once at import; the PID tells gunicorn workers apart
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s [%(process)d] %(levelname)s %(name)s: %(message)s",
+)
 logger = logging.getLogger(__name__)
 
-# Create cookie file from environment variable if it exists
 COOKIE_FILE = os.path.join(app.config["DOWNLOAD_FOLDER"], "youtube_cookies.txt")
-cookie_content = os.environ.get("YOUTUBE_COOKIES")
-if cookie_content and not os.path.exists(COOKIE_FILE):
+
+# How long a cookie file written from YOUTUBE_COOKIES counts as fresh, and
+# how long request handlers trust their last check for the file
+COOKIE_FILE_TTL = 3600
+COOKIE_CHECK_TTL = 60
+
+_cookie_check = {"checked_at": None, "path": None}
+
+
+# Create cookie file from environment variable, unless a fresh one exists
+def ensure_youtube_cookies(ttl=COOKIE_FILE_TTL):
+    cookie_content = os.environ.get("YOUTUBE_COOKIES")
+    if not cookie_content:
+        return
     try:
-        with open(COOKIE_FILE, "w") as f:
+        if time.time() - os.path.getmtime(COOKIE_FILE) < ttl:
+            return
+    except OSError:
+        pass
+    # Write to a per-process temp file and rename it into place, so workers
+    # booting at the same time never read a half-written cookie file
+    tmp_path = f"{COOKIE_FILE}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "w") as f:
             f.write(cookie_content)
-        logger.info(f"Created cookie file from environment variable: {COOKIE_FILE}")
+        os.replace(tmp_path, COOKIE_FILE)
+        logger.info("Created cookie file from environment variable: %s", COOKIE_FILE)
     except Exception as e:
-        logger.error(f"Failed to create cookie file: {str(e)}")
+        logger.error("Failed to create cookie file: %s", e)
+
+
+# Function to get the cookie file path if one is available. The answer is
+# cached briefly so hot paths don't stat the file on every request.
+def get_cookie_file():
+    now = time.monotonic()
+    checked_at = _cookie_check["checked_at"]
+    if checked_at is None or now - checked_at > COOKIE_CHECK_TTL:
+        _cookie_check["path"] = COOKIE_FILE if os.path.exists(COOKIE_FILE) else None
+        _cookie_check["checked_at"] = now
+    return _cookie_check["path"]
+
+
+ensure_youtube_cookies()
 
 # Load YouTube API keys from environment variables
 YOUTUBE_API_KEYS = []
@@ -71,7 +151,7 @@ if not YOUTUBE_API_KEYS:
     ]
 
 # Log the number of API keys loaded
-logger.info(f"Loaded {len(YOUTUBE_API_KEYS)} YouTube API keys")
+logger.info("Loaded %s YouTube API keys", len(YOUTUBE_API_KEYS))
 
 # List of user agents to rotate
 USER_AGENTS = [
@@ -83,33 +163,1094 @@ USER_AGENTS = [
 ]
 
 
-# Function to get a random API key
-def get_random_api_key():
+# How often yt-dlp retries a dropped connection. Retries resume from the
+# last received byte with a Range request and back off exponentially.
+YTDLP_RETRIES = max(0, int(os.environ.get("YTDLP_RETRIES", "10")))
+
+# YouTube player clients yt-dlp asks for formats, e.g. "web_safari" or
+# "tv,ios". yt-dlp's default tries several, one player request each;
+# naming the one that works from this host skips the rest. Unset keeps
+# yt-dlp's default.
+YTDLP_PLAYER_CLIENT = os.environ.get("YTDLP_PLAYER_CLIENT", "")
+
+# Browser that yt-dlp's requests impersonate, e.g. "chrome" (needs
+# pip install "yt-dlp[curl-cffi]"). The reused YoutubeDL instances keep
+# their connections alive either way; this makes the TLS handshake look
+# like a browser's. Unset sends plain requests.
+YTDLP_IMPERSONATE = os.environ.get("YTDLP_IMPERSONATE", "")
+
+
+# MP3 output up to this size is kept in memory; larger files spill to a
+# temporary file that is removed as soon as it is closed
+SPOOL_MAX_SIZE = int(os.environ.get("SPOOL_MAX_SIZE", 8 * 1024 * 1024))
+
+# Media is moved between the pipeline and its output in large chunks to
+# keep the number of read/write syscalls (and Python loop iterations) low
+STREAM_CHUNK_SIZE = 256 * 1024
+
+# Kernel capacity requested for the pipeline's pipes (Linux defaults to
+# 64 KiB), so a whole chunk can sit in the pipe between reads instead of
+# yt-dlp and FFmpeg stalling on a full pipe. Bigger pipes count against the
+# user's fs.pipe-user-pages-soft (64 MiB); past it, Linux gives every new
+# pipe of that user only two pages, so this stays at one chunk. fcntl only
+# names F_SETPIPE_SZ from Python 3.10.
+PIPE_SIZE = int(os.environ.get("PIPE_SIZE", STREAM_CHUNK_SIZE))
+F_SETPIPE_SZ = getattr(fcntl, "F_SETPIPE_SZ", 1031)
+
+
+# YouTube Data API endpoint, called directly through a shared session
+YOUTUBE_API_URL = "https://www.googleapis.com/youtube/v3"
+
+# One pooled session for all outbound HTTP so TCP/TLS connections are
+# kept alive between requests instead of being re-established every time
+SESSION = requests.Session()
+_http_adapter = HTTPAdapter(
+    pool_connections=32,
+    pool_maxsize=64,
+    max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[502, 503, 504]),
+)
+SESSION.mount("https://", _http_adapter)
+SESSION.mount("http://", _http_adapter)
+
+
+# /api/info/batch chunks and coalesced /api/info lookups are fetched here
+METADATA_POOL = ThreadPoolExecutor(max_workers=8, thread_name_prefix="metadata")
+
+# Downloads and transcodes run on a bounded pool shared by all request
+# threads, so a burst of requests queues here instead of starting an
+# unbounded number of yt-dlp and FFmpeg processes
+DOWNLOAD_POOL = ThreadPoolExecutor(
+    max_workers=int(os.environ.get("DL_POOL", "16")), thread_name_prefix="download"
+)
+
+
+# Helper function to take one of the download pool's workers for a download
+# that has to run on the request thread, such as a streamed one, so it
+# counts against the same bound. Blocks until a worker is free and returns
+# an event to set once the download is over.
+def reserve_download_worker():
+    reserved = threading.Event()
+    done = threading.Event()
+
+    def hold():
+        reserved.set()
+        done.wait()
+
+    DOWNLOAD_POOL.submit(hold)
+    reserved.wait()
+    return done
+
+
+# When running behind nginx, USE_XACCEL=1 hands finished files to nginx
+# through X-Accel-Redirect so it serves them with sendfile(2) instead of
+# Python copying the bytes. nginx needs a matching internal location, e.g.
+#   location /internal_downloads/ { internal; alias /app/downloads/; }
+USE_XACCEL = os.environ.get("USE_XACCEL") == "1"
+XACCEL_PREFIX = os.environ.get("XACCEL_PREFIX", "/internal_downloads").rstrip("/")
+
+# Behind Apache (mod_xsendfile) or lighttpd, USE_X_SENDFILE=1 does the same
+# through Flask's X-Sendfile support
+app.config["USE_X_SENDFILE"] = os.environ.get("USE_X_SENDFILE") == "1"
+
+# Names for files handed to the proxy only need to be unique within the
+# downloads folder, so a per-process counter plus the PID is enough
+DOWNLOAD_COUNTER = itertools.count()
+
+# Finished downloads are kept in AUDIO_CACHE_DIR by video ID and format, so
+# repeat requests are served from disk without downloading or transcoding
+# again. Least recently used entries are evicted once the cache grows past
+# AUDIO_CACHE_MAX_MB; 0 turns the cache off. Behind nginx the default cache
+# directory sits inside downloads/, so the existing XACCEL_PREFIX location
+# serves it; a cache elsewhere needs its own internal location, given in
+# XACCEL_CACHE_PREFIX.
+AUDIO_CACHE_DIR = os.path.abspath(
+    os.environ.get(
+        "AUDIO_CACHE_DIR", os.path.join(app.config["DOWNLOAD_FOLDER"], "audio_cache")
+    )
+)
+AUDIO_CACHE_MAX_BYTES = int(os.environ.get("AUDIO_CACHE_MAX_MB", "1024")) * 1024 * 1024
+XACCEL_CACHE_PREFIX = os.environ.get(
+    "XACCEL_CACHE_PREFIX", f"{XACCEL_PREFIX}/audio_cache"
+).rstrip("/")
+if AUDIO_CACHE_MAX_BYTES > 0:
+    os.makedirs(AUDIO_CACHE_DIR, exist_ok=True)
+
+# Background download jobs (POST /api/download/audio) keep their state in
+# the downloads folder, so any worker can report on or serve a job:
+# job-<id>.part while it runs, then job-<id>.json plus job-<id>.<ext>
+JOB_ID_RE = re.compile(r"[0-9a-f]{32}")
+
+# Files in the downloads folder older than DOWNLOAD_MAX_AGE seconds are
+# removed by a background janitor that runs every DOWNLOAD_CLEANUP_INTERVAL
+DOWNLOAD_MAX_AGE = int(os.environ.get("DOWNLOAD_MAX_AGE", "1800"))
+DOWNLOAD_CLEANUP_INTERVAL = int(os.environ.get("DOWNLOAD_CLEANUP_INTERVAL", "300"))
+
+
+# Video metadata barely changes, so /api/info results are cached per video
+# ID for a while to save an API round trip and quota on repeat lookups
+INFO_CACHE = TTLCache(
+    maxsize=int(os.environ.get("INFO_CACHE_SIZE", "1024")),
+    ttl=int(os.environ.get("INFO_CACHE_TTL", "600")),
+)
+INFO_CACHE_LOCK = threading.Lock()
+INFO_CACHE_STATS = {"hits": 0, "misses": 0, "revalidated": 0}
+
+# Expired results are kept longer with the Data API's ETag, so a lookup
+# after INFO_CACHE_TTL can send If-None-Match and reuse them on a 304
+INFO_ETAGS = TTLCache(
+    maxsize=INFO_CACHE.maxsize,
+    ttl=int(os.environ.get("INFO_ETAG_TTL", "86400")),
+)
+
+# The Data API's videos endpoint takes up to 50 IDs per call; larger
+# /api/info/batch requests are split and the chunks fetched concurrently
+YOUTUBE_API_BATCH_SIZE = 50
+INFO_BATCH_MAX_URLS = int(os.environ.get("INFO_BATCH_MAX_URLS", "500"))
+
+# Concurrent /api/info cache misses are coalesced: the first one waits up to
+# INFO_BATCH_WINDOW_MS for others to join, then they go out as one videos
+# call of up to 50 IDs. 0 looks every video up on its own.
+INFO_BATCH_WINDOW = float(os.environ.get("INFO_BATCH_WINDOW_MS", "20")) / 1000
+INFO_BATCH_QUEUE = queue.Queue()
+
+# /api/info cache misses being looked up right now, by video ID
+INFO_INFLIGHT = {}
+INFO_INFLIGHT_LOCK = threading.Lock()
+
+# USE_YTDLP_META=1 gets /api/info results from yt-dlp instead of the quota
+# limited Data API, which is still used if yt-dlp fails and by the batch
+# endpoint
+USE_YTDLP_META = os.environ.get("USE_YTDLP_META") == "1"
+
+
+# API keys are handed out round-robin. A key that runs out of quota sits out
+# for API_KEY_COOLDOWN seconds instead of failing every Nth request.
+API_KEY_COOLDOWN = int(os.environ.get("API_KEY_COOLDOWN", "3600"))
+API_KEY_CURSOR = itertools.cycle(range(len(YOUTUBE_API_KEYS)))
+API_KEY_COOLDOWNS = [0.0] * len(YOUTUBE_API_KEYS)
+API_KEY_LOCK = threading.Lock()
+
+# Data API error reasons that mean the key itself is out of quota
+QUOTA_ERROR_REASONS = {"quotaExceeded", "dailyLimitExceeded", "rateLimitExceeded"}
+
+
+class ApiKeysExhausted(Exception):
+    """Raised when every YouTube API key is cooling down"""
+
+
+# Function to get the next API key that isn't cooling down
+def get_api_key():
     if not YOUTUBE_API_KEYS:
         raise ValueError("No YouTube API keys available")
-    return random.choice(YOUTUBE_API_KEYS)
+    with API_KEY_LOCK:
+        now = time.time()
+        for _ in range(len(YOUTUBE_API_KEYS)):
+            index = next(API_KEY_CURSOR)
+            if API_KEY_COOLDOWNS[index] <= now:
+                return YOUTUBE_API_KEYS[index]
+    raise ApiKeysExhausted("All YouTube API keys are out of quota")
+
+
+# Function to take an out-of-quota API key out of rotation for a while
+def cool_down_api_key(api_key):
+    with API_KEY_LOCK:
+        API_KEY_COOLDOWNS[YOUTUBE_API_KEYS.index(api_key)] = (
+            time.time() + API_KEY_COOLDOWN
+        )
+    logger.warning("YouTube API key out of quota, cooling down for %ss", API_KEY_COOLDOWN)
+
+
+# Helper function to tell whether a failed Data API call ran out of quota
+def is_quota_error(response):
+    if response.status_code != 403:
+        return False
+    try:
+        errors = response.json()["error"]["errors"]
+    except (ValueError, KeyError, TypeError):
+        return False
+    return any(error.get("reason") in QUOTA_ERROR_REASONS for error in errors)
+
+
+# User agents are rotated round-robin; next() on a cycle is atomic under the
+# GIL, so no lock is needed
+USER_AGENT_CURSOR = itertools.cycle(USER_AGENTS)
 
 
-# Function to get a random user agent
-def get_random_user_agent():
-    return random.choice(USER_AGENTS)
+# Function to get the next user agent
+def get_user_agent():
+    return next(USER_AGENT_CURSOR)
+
+
+# Matches the 11-character video ID in watch, youtu.be, shorts and embed URLs,
+# wherever v= sits in the query string. If v= appears more than once the
+# first one wins, as it does in yt-dlp. The pattern is anchored at the
+# scheme and host, so a YouTube URL buried in another site's URL doesn't
+# pass and get handed to yt-dlp's generic extractor.
+VIDEO_ID_RE = re.compile(
+    r"(?:https?://)?(?:(?:www|m|music)\.)?"
+    r"(?:youtube\.com/(?:watch\?(?:[^#&]*&)*?v=|shorts/|embed/)|youtu\.be/)"
+    r"([A-Za-z0-9_-]{11})(?![A-Za-z0-9_-])"
+)
 
 
 # Helper function to extract video ID from URL
 def extract_video_id(url):
-    if "youtube.com/watch" in url:
-        return url.split("v=")[1].split("&")[0]
-    elif "youtu.be/" in url:
-        return url.split("youtu.be/")[1].split("?")[0]
-    else:
+    match = VIDEO_ID_RE.match(url)
+    if not match:
         raise ValueError("Invalid YouTube URL")
+    return match.group(1)
+
+
+# Each thread keeps its YoutubeDL instances (one per distinct set of options)
+# so extractor setup and caches such as player JS survive between requests.
+# YoutubeDL is not thread-safe, hence one set per thread.
+_ydl_local = threading.local()
+
+
+# Helper function to get a reusable YoutubeDL for the given options
+def get_ydl(opts):
+    cache = getattr(_ydl_local, "instances", None)
+    if cache is None:
+        cache = _ydl_local.instances = {}
+    key = orjson.dumps(opts, option=orjson.OPT_SORT_KEYS)
+    ydl = cache.get(key)
+    if ydl is None:
+        ydl = cache[key] = yt_dlp.YoutubeDL(opts)
+    return ydl
+
+
+# Helper function to build a Content-Disposition header for a download,
+# with an RFC 5987 filename* for non-ASCII titles
+def attachment_disposition(download_name):
+    simple = unicodedata.normalize("NFKD", download_name)
+    simple = simple.encode("ascii", "ignore").decode("ascii")
+    quoted = quote(download_name, safe="!#$&+-.^_`|~")
+    return dump_options_header(
+        "attachment", {"filename": simple, "filename*": f"UTF-8''{quoted}"}
+    )
+
+
+class AudioPipelineError(Exception):
+    """Raised when the yt-dlp | FFmpeg pipeline fails"""
+
+
+# yt-dlp options shared by every download; the format, user agent, title
+# pipe and URL are added per request
+DOWNLOAD_CMD = [
+    "yt-dlp",
+    "--no-warnings",
+    "--no-progress",
+    "--geo-bypass",
+    "--no-check-certificate",
+    "--retries", str(YTDLP_RETRIES),
+    "--fragment-retries", str(YTDLP_RETRIES),
+    "--retry-sleep", "http:exp=1:30",  # 1s, 2s, 4s... capped at 30s
+    "--retry-sleep", "fragment:exp=1:30",
+    "--no-playlist",  # The video itself, even for URLs with &list=
+    "--referer", "https://www.youtube.com/",
+    *(
+        ["--extractor-args", f"youtube:player_client={YTDLP_PLAYER_CLIENT}"]
+        if YTDLP_PLAYER_CLIENT
+        else []
+    ),
+    *(["--impersonate", YTDLP_IMPERSONATE] if YTDLP_IMPERSONATE else []),
+    "-o", "-",  # Write the media to stdout
+]
+
+# yt-dlp format selector for each audio format a download can be made in.
+# "mp3" is transcoded by FFmpeg; the others are sent as YouTube serves them,
+# "native" in whichever container has the best audio and "m4a" / "webm" in
+# the one a client's Accept header asked for.
+AUDIO_FORMATS = {
+    "mp3": "bestaudio/best",
+    "native": "bestaudio",
+    "m4a": "bestaudio[ext=m4a]",
+    "webm": "bestaudio[ext=webm]",
+}
+
+
+# MP3 encoding is the one CPU-bound step of a download; FFmpeg runs at this
+# niceness so a few transcodes can't starve the workers serving requests
+FFMPEG_NICE = int(os.environ.get("FFMPEG_NICE", "5"))
+
+# Host-wide cap on concurrent MP3 transcodes; further downloads wait for a
+# free slot before starting. Transcoding mostly waits on the download, so
+# it's off (0) by default. On hosts where encodes are CPU-bound, nproc - 1
+# gives every running one a core. A slot is a lock on a file in
+# FFMPEG_SLOT_DIR, held by the FFmpeg process itself, so it is freed
+# whenever FFmpeg exits, even if the worker that started it is killed.
+FFMPEG_MAX_PROCS = int(os.environ.get("FFMPEG_MAX_PROCS", "0"))
+FFMPEG_SLOT_DIR = os.path.join(app.config["DOWNLOAD_FOLDER"], "ffmpeg_slots")
+if FFMPEG_MAX_PROCS > 0:
+    os.makedirs(FFMPEG_SLOT_DIR, exist_ok=True)
+
+# FFmpeg command that reads media from stdin and writes MP3 to stdout
+CONVERT_CMD = [
+    *(["nice", "-n", str(FFMPEG_NICE)] if FFMPEG_NICE else []),
+    "ffmpeg",
+    "-i", "pipe:0",  # Read from yt-dlp's stdout
+    "-vn",  # No video
+    "-ar", "44100",  # Audio sample rate
+    "-ac", "2",      # Stereo
+    "-b:a", "192k",  # Bitrate
+    "-f", "mp3",     # Format
+    "-loglevel", "error",
+    "-nostats",
+    "pipe:1",  # Write the MP3 to stdout
+]
+
+
+# Helper function to grow a pipe's kernel buffer to PIPE_SIZE. This is only
+# an optimization: the kernel may refuse (e.g. above fs.pipe-max-size).
+def enlarge_pipe(pipe):
+    try:
+        fcntl.fcntl(pipe.fileno(), F_SETPIPE_SZ, PIPE_SIZE)
+    except OSError:
+        pass
+
+
+# Helper function to wait for a free FFmpeg slot, returning a file
+# descriptor that holds it until closed (None when there is no cap)
+def acquire_ffmpeg_slot():
+    if FFMPEG_MAX_PROCS <= 0:
+        return None
+    while True:
+        for slot in range(FFMPEG_MAX_PROCS):
+            fd = os.open(os.path.join(FFMPEG_SLOT_DIR, str(slot)), os.O_RDWR | os.O_CREAT)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return fd
+            except BlockingIOError:
+                os.close(fd)
+        time.sleep(0.1)
+
+
+# Helper function to start one of the pipeline's processes. Its stderr goes to
+# an anonymous temporary file instead of a pipe: nothing reads stderr until
+# the output is done, and a process that logs more than a pipe holds (yt-dlp
+# retry messages, say) would block on it and stall the whole pipeline.
+def start_pipeline_process(cmd, **kwargs):
+    error_log = tempfile.TemporaryFile()
+    try:
+        process = subprocess.Popen(
+            cmd,
+            stdout=subprocess.PIPE,
+            stderr=error_log,
+            bufsize=STREAM_CHUNK_SIZE,
+            **kwargs,
+        )
+    except Exception:
+        error_log.close()
+        raise
+    process.stderr = error_log
+    return process
+
+
+# Helper function to start downloading a video's audio in one of
+# AUDIO_FORMATS, either converted to MP3 or in the container YouTube serves
+# it in. Returns the started processes, the audio being read from the last
+# one's stdout, and a pipe that yt-dlp writes the video's title to before
+# the download starts.
+def start_audio_pipeline(url, audio_format="mp3"):
+    # Download the audio using yt-dlp command line and pipe it straight
+    # into FFmpeg, so the source media never has to be staged on disk
+    # This is more reliable than using the Python API for problematic videos
+    logger.info("Downloading audio using yt-dlp command line...")
+    convert = audio_format == "mp3"
+    # Wait for a transcode slot first, so queued downloads don't start yet
+    slot = acquire_ffmpeg_slot() if convert else None
+    title_read, title_write = os.pipe()
+    download_cmd = [
+        *DOWNLOAD_CMD,
+        # Audio-only when available; FFmpeg can also strip video from 'best'
+        "-f", AUDIO_FORMATS[audio_format],
+        "--user-agent", get_user_agent(),
+        # The title comes from the same extraction as the download; stdout
+        # carries the media, so it is written to a pipe of its own
+        "--print-to-file", "%(title)s", f"/dev/fd/{title_write}",
+        url
+    ]
+
+    # Add cookies if available
+    cookie_file = get_cookie_file()
+    if cookie_file:
+        download_cmd.extend(["--cookies", cookie_file])
+
+    try:
+        downloader = start_pipeline_process(download_cmd, pass_fds=(title_write,))
+    except Exception:
+        os.close(title_read)
+        if slot is not None:
+            os.close(slot)
+        raise
+    finally:
+        os.close(title_write)
+    title_pipe = os.fdopen(title_read, "rb")
+    enlarge_pipe(downloader.stdout)
+
+    # Without conversion the downloaded stream is the result
+    if not convert:
+        return [downloader], title_pipe
+
+    # Run download and conversion as one pipeline
+    try:
+        converter = start_pipeline_process(
+            CONVERT_CMD,
+            stdin=downloader.stdout,
+            # FFmpeg inherits the slot lock and holds it until it exits
+            pass_fds=() if slot is None else (slot,),
+        )
+    except Exception:
+        kill_audio_pipeline([downloader])
+        title_pipe.close()
+        raise
+    finally:
+        # Only FFmpeg reads the pipe now; closing our copy lets yt-dlp
+        # get SIGPIPE if FFmpeg exits early
+        downloader.stdout.close()
+        if slot is not None:
+            os.close(slot)
+    enlarge_pipe(converter.stdout)
+
+    return [downloader, converter], title_pipe
+
+
+# Helper function to read the title yt-dlp wrote to a pipeline's title pipe.
+# yt-dlp writes it before downloading, so this only waits while the video is
+# being extracted.
+def read_video_title(title_pipe):
+    with title_pipe:
+        video_title = title_pipe.readline().decode(errors="replace").strip()
+    if not video_title:
+        logger.warning("Could not get video title")
+        return "audio"  # Default title
+    logger.info("Video title: %s", video_title)
+    return video_title
+
+
+# Helper function to wait for a pipeline's processes once its output has been
+# read, raising AudioPipelineError if any of them failed
+def finish_audio_pipeline(processes):
+    processes[-1].stdout.close()
+    for process in processes:
+        process.wait()
+    errors = []
+    for process in processes:
+        process.stderr.seek(0)
+        errors.append(process.stderr.read().decode(errors="replace"))
+
+    downloader = processes[0]
+    if downloader.returncode != 0:
+        logger.error("yt-dlp download failed with exit code %s", downloader.returncode)
+        logger.error("Command error: %s", errors[0])
+        raise AudioPipelineError(f"Video download failed: {errors[0]}")
+
+    if len(processes) > 1 and processes[1].returncode != 0:
+        converter = processes[1]
+        logger.error("FFmpeg conversion failed with exit code %s", converter.returncode)
+        logger.error("FFmpeg stderr: %s", errors[1])
+        raise AudioPipelineError(
+            f"Audio conversion failed with exit code {converter.returncode}"
+        )
+
+
+# Helper function to kill whatever is still running in a pipeline and drop
+# its error logs
+def kill_audio_pipeline(processes):
+    for process in processes:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+        process.stderr.close()
+
+
+# Helper function to copy a pipe into output in large chunks, returning a
+# digest of the bytes that serves as the response's ETag
+def copy_stream(source, output):
+    digest = hashlib.blake2b(digest_size=16)
+    while True:
+        chunk = source.read(STREAM_CHUNK_SIZE)
+        if not chunk:
+            break
+        digest.update(chunk)
+        output.write(chunk)
+    return digest.hexdigest()
+
+
+# Helper function to download a video's audio into output. Returns the number
+# of bytes written, their digest and the video's title.
+def download_audio_file(url, output, audio_format="mp3"):
+    processes, title_pipe = start_audio_pipeline(url, audio_format)
+    try:
+        etag = copy_stream(processes[-1].stdout, output)
+        finish_audio_pipeline(processes)
+    finally:
+        kill_audio_pipeline(processes)
+    video_title = read_video_title(title_pipe)
+
+    size = output.tell()
+    if not size:
+        logger.error("Download produced no output")
+        raise AudioPipelineError(
+            "MP3 file not created" if audio_format == "mp3" else "Audio file not created"
+        )
+
+    logger.info("Download completed successfully (%s bytes)", size)
+    return size, etag, video_title
+
+
+# Generator that streams a started pipeline's output as it is produced,
+# beginning with the chunk already read to detect the format
+def stream_audio_pipeline(processes, first_chunk):
+    output = processes[-1].stdout
+    try:
+        chunk = first_chunk
+        while chunk:
+            yield chunk
+            chunk = output.read1(STREAM_CHUNK_SIZE)
+        # Headers are already sent, so a failure can only be logged here
+        finish_audio_pipeline(processes)
+        logger.info("Streamed download completed successfully")
+    except AudioPipelineError:
+        pass
+    finally:
+        # Also runs when the client disconnects early
+        kill_audio_pipeline(processes)
+
+
+# Helper function to tell which container a native audio download is in from
+# its first bytes, returning its file extension and MIME type
+def detect_audio_format(header):
+    if header[4:8] == b"ftyp":
+        return "m4a", "audio/mp4"
+    if header[:4] == b"\x1a\x45\xdf\xa3":
+        return "webm", "audio/webm"
+    return "audio", "application/octet-stream"
+
+
+# Helper function to get the extension and MIME type of a finished download
+def audio_file_type(output, audio_format):
+    if audio_format == "mp3":
+        return "mp3", "audio/mpeg"
+    output.seek(0)
+    return detect_audio_format(output.read(12))
+
+
+# Helper function to replace a JSON file atomically so readers in other
+# workers never see half of it. The temp name is unique per process and
+# thread, so concurrent writers of the same file don't clobber each other.
+def write_json_file(path, data):
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(orjson.dumps(data))
+    os.replace(tmp_path, path)
+
+
+# Helper function to send an audio file from disk, through nginx when
+# USE_XACCEL is set. send_file handles Range and If-None-Match (or sets
+# X-Sendfile) itself.
+def send_audio_file(path, xaccel_uri, mimetype, download_name, etag):
+    if USE_XACCEL:
+        return Response(
+            mimetype=mimetype,
+            headers={
+                "X-Accel-Redirect": xaccel_uri,
+                "Content-Disposition": attachment_disposition(download_name),
+            },
+        )
+    try:
+        response = send_file(
+            path,
+            mimetype=mimetype,
+            as_attachment=True,
+            download_name=download_name,
+            etag=etag,
+        )
+    except RequestedRangeNotSatisfiable as e:
+        return e
+    response.headers["Accept-Ranges"] = "bytes"
+    return response
+
+
+# Helper function to get the path of one of a download job's files
+def job_path(job_id, suffix):
+    return os.path.abspath(
+        os.path.join(app.config["DOWNLOAD_FOLDER"], f"job-{job_id}{suffix}")
+    )
+
+
+# Helper function to read a download job's status, or None if there is no
+# such job (or it has been cleaned up)
+def read_job_status(job_id):
+    try:
+        with open(job_path(job_id, ".json"), "rb") as f:
+            return orjson.loads(f.read())
+    except FileNotFoundError:
+        pass
+    try:
+        # Not finished yet; report how much audio has been written so far
+        return {"status": "running", "bytes": os.path.getsize(job_path(job_id, ".part"))}
+    except FileNotFoundError:
+        return None
+
+
+# Runs a background download job on the download pool, leaving the audio and
+# its status in the downloads folder
+def run_download_job(job_id, url, audio_format):
+    part_path = job_path(job_id, ".part")
+    try:
+        # The .part made at enqueue time is created again if the janitor
+        # removed it while the job was queued
+        with open(part_path, "w+b", buffering=1024 * 1024) as output:
+            # With the audio cache on, jobs share it with GET downloads
+            if AUDIO_CACHE_MAX_BYTES > 0:
+                video_id = extract_video_id(url)
+                entry = get_cached_audio(video_id, audio_format) or cache_audio_file(
+                    url, video_id, audio_format
+                )
+                audio_path = os.path.join(AUDIO_CACHE_DIR, entry["filename"])
+                size, etag, video_title = entry["bytes"], entry["etag"], entry["title"]
+                extension, mimetype = entry["extension"], entry["mimetype"]
+            else:
+                size, etag, video_title = download_audio_file(url, output, audio_format)
+                extension, mimetype = audio_file_type(output, audio_format)
+                audio_path = part_path
+        # A hard link, so the job keeps its audio if the cache evicts it
+        os.link(audio_path, job_path(job_id, f".{extension}"))
+        status = {
+            "status": "done",
+            "bytes": size,
+            "etag": etag,
+            "title": video_title,
+            "extension": extension,
+            "mimetype": mimetype,
+        }
+    except Exception as e:
+        logger.error("Download job %s failed: %s", job_id, e)
+        error = str(e) if isinstance(e, AudioPipelineError) else "Internal server error"
+        status = {"status": "error", "error": error}
+
+    # The .part goes only once the status is written, so a status check in
+    # between never finds neither and reports the job missing
+    write_json_file(job_path(job_id, ".json"), status)
+    if os.path.exists(part_path):
+        os.remove(part_path)
+
+
+# Helper function to look up a download in the audio cache. Returns the
+# entry's metadata, or None on a miss.
+def get_cached_audio(video_id, audio_format):
+    key = f"{video_id}-{audio_format}"
+    try:
+        with open(os.path.join(AUDIO_CACHE_DIR, f"{key}.json"), "rb") as f:
+            entry = orjson.loads(f.read())
+        # Mark the entry as recently used for eviction
+        os.utime(os.path.join(AUDIO_CACHE_DIR, entry["filename"]))
+    except (OSError, ValueError, KeyError):
+        return None
+    return entry
+
+
+# Helper function to download a video's audio straight into the audio cache,
+# returning the new entry's metadata
+def cache_audio_file(url, video_id, audio_format):
+    key = f"{video_id}-{audio_format}"
+    fd, part_path = tempfile.mkstemp(dir=AUDIO_CACHE_DIR, suffix=".part")
+    try:
+        with os.fdopen(fd, "w+b", buffering=1024 * 1024) as output:
+            size, etag, video_title = download_audio_file(url, output, audio_format)
+            extension, mimetype = audio_file_type(output, audio_format)
+        filename = f"{key}.{extension}"
+        os.replace(part_path, os.path.join(AUDIO_CACHE_DIR, filename))
+    except Exception:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+        raise
+
+    entry = {
+        "filename": filename,
+        "bytes": size,
+        "etag": etag,
+        "title": video_title,
+        "extension": extension,
+        "mimetype": mimetype,
+    }
+    write_json_file(os.path.join(AUDIO_CACHE_DIR, f"{key}.json"), entry)
+    return entry
+
+
+# Helper function to send an audio cache entry
+def send_cached_audio(entry):
+    return send_audio_file(
+        os.path.join(AUDIO_CACHE_DIR, entry["filename"]),
+        f"{XACCEL_CACHE_PREFIX}/{entry['filename']}",
+        entry["mimetype"],
+        f"{entry['title']}.{entry['extension']}",
+        entry["etag"],
+    )
+
+
+# Helper function to delete least recently used audio cache entries until the
+# cache fits in AUDIO_CACHE_MAX_BYTES. Downloads still being written (.part)
+# and temp files don't count towards the size and are left alone, unless
+# they are older than DOWNLOAD_MAX_AGE and so were left by a crashed worker.
+def evict_audio_cache():
+    files = []
+    total = 0
+    cutoff = time.time() - DOWNLOAD_MAX_AGE
+    with os.scandir(AUDIO_CACHE_DIR) as entries:
+        for entry in entries:
+            if not entry.is_file() or entry.name.endswith(".json"):
+                continue
+            try:
+                stat = entry.stat()
+                if entry.name.endswith((".part", ".tmp")):
+                    if stat.st_mtime < cutoff:
+                        os.unlink(entry.path)
+                        logger.info("Removed stale cache file: %s", entry.name)
+                    continue
+            except OSError:
+                continue  # Removed by another worker
+            files.append((stat.st_mtime, stat.st_size, entry))
+            total += stat.st_size
+
+    files.sort(key=lambda f: f[0])
+    for _, size, entry in files:
+        if total <= AUDIO_CACHE_MAX_BYTES:
+            break
+        key = entry.name.rsplit(".", 1)[0]
+        for path in (os.path.join(AUDIO_CACHE_DIR, f"{key}.json"), entry.path):
+            try:
+                os.unlink(path)
+            except OSError:
+                pass  # Already removed by another worker
+        total -= size
+        logger.info("Evicted cached audio: %s", entry.name)
+
+
+# Helper function to look up /api/info results in the cache, counting hits
+# and misses for /api/cache-stats
+def get_cached_video_info(video_id):
+    with INFO_CACHE_LOCK:
+        video_info = INFO_CACHE.get(video_id)
+        if video_info is None:
+            INFO_CACHE_STATS["misses"] += 1
+        else:
+            INFO_CACHE_STATS["hits"] += 1
+    return video_info
+
+
+# Helper function to format a Data API video resource as an /api/info result
+def format_video_metadata(video):
+    return {
+        "title": video["snippet"]["title"],
+        "author": video["snippet"]["channelTitle"],
+        "description": video["snippet"]["description"],
+        "thumbnail_url": video["snippet"]["thumbnails"]["high"]["url"],
+        "views": int(video["statistics"].get("viewCount", 0)),
+        "length_seconds": convert_duration(video["contentDetails"]["duration"]),
+    }
+
+
+# Helper function to call the Data API's videos endpoint, moving on to the
+# next API key while the current one is out of quota
+def request_videos(video_ids, etag=None):
+    headers = {"If-None-Match": etag} if etag else None
+    for _ in range(len(YOUTUBE_API_KEYS)):
+        api_key = get_api_key()
+
+        # Get video details
+        response = SESSION.get(
+            f"{YOUTUBE_API_URL}/videos",
+            params={
+                "part": "snippet,contentDetails,statistics",
+                "id": ",".join(video_ids),
+                "key": api_key,
+            },
+            headers=headers,
+            timeout=10,
+        )
+        if not is_quota_error(response):
+            break
+        cool_down_api_key(api_key)
+    response.raise_for_status()
+    return response
+
+
+# Helper function to get the metadata of up to 50 videos from the YouTube
+# Data API in one call. Returns a dict keyed by video ID that leaves out videos
+# that don't exist; API errors raise requests errors.
+def fetch_videos_metadata(video_ids):
+    video_response = request_videos(video_ids).json()
+
+    return {
+        video["id"]: format_video_metadata(video)
+        for video in video_response.get("items", [])
+    }
+
+
+# Helper function to get a video's metadata from the YouTube Data API.
+# Returns None if the video doesn't exist; API errors raise requests errors.
+def fetch_video_metadata(video_id):
+    with INFO_CACHE_LOCK:
+        etag, video_info = INFO_ETAGS.get(video_id, (None, None))
+
+    response = request_videos([video_id], etag)
+    if response.status_code == 304:
+        with INFO_CACHE_LOCK:
+            INFO_CACHE_STATS["revalidated"] += 1
+        return video_info
+
+    video_response = response.json()
+    if not video_response.get("items"):
+        return None
+
+    video_info = format_video_metadata(video_response["items"][0])
+    if response.headers.get("ETag"):
+        with INFO_CACHE_LOCK:
+            INFO_ETAGS[video_id] = (response.headers["ETag"], video_info)
+    return video_info
+
+
+# Helper function to build the YoutubeDL options for extracting a video's
+# info without downloading it
+def info_ydl_opts():
+    info_opts = {
+        "quiet": True,
+        "no_warnings": True,
+        "user_agent": get_user_agent(),
+        "referer": "https://www.youtube.com/",
+        "nocheckcertificate": True,
+        "geo_bypass": True,
+        "skip_download": True,  # Don't download, just get info
+        "noplaylist": True,
+    }
+    if YTDLP_PLAYER_CLIENT:
+        info_opts["extractor_args"] = {
+            "youtube": {"player_client": YTDLP_PLAYER_CLIENT.split(",")}
+        }
+    if YTDLP_IMPERSONATE:
+        info_opts["impersonate"] = ImpersonateTarget.from_str(YTDLP_IMPERSONATE.lower())
+
+    # Add cookies if available
+    cookie_file = get_cookie_file()
+    if cookie_file:
+        info_opts["cookiefile"] = cookie_file
+    return info_opts
+
+
+# Helper function to get a video's /api/info result with yt-dlp, which costs
+# no Data API quota
+def extract_video_metadata(video_id):
+    # process=False returns the extractor's result as-is, skipping format
+    # sorting and selection, which /api/info doesn't need
+    info = get_ydl(info_ydl_opts()).extract_info(
+        f"https://www.youtube.com/watch?v={video_id}", download=False, process=False
+    )
+    return {
+        "title": info.get("title"),
+        "author": info.get("uploader") or info.get("channel"),
+        "description": info.get("description"),
+        # The Data API's "high" thumbnail
+        "thumbnail_url": f"https://i.ytimg.com/vi/{video_id}/hqdefault.jpg",
+        "views": int(info.get("view_count") or 0),
+        "length_seconds": int(info.get("duration") or 0),
+    }
+
+
+# Helper function to get the googlevideo URL of a video's best audio-only
+# format, for clients that fetch the stream from YouTube themselves
+def extract_audio_url(video_id, audio_format="native"):
+    info = get_ydl({**info_ydl_opts(), "format": AUDIO_FORMATS[audio_format]}).extract_info(
+        f"https://www.youtube.com/watch?v={video_id}", download=False
+    )
+    return info["url"]
+
+
+# Helper function to look a video up through the /api/info micro-batcher.
+# Returns None if the video doesn't exist; API errors are raised as usual.
+def lookup_video_metadata(video_id):
+    if INFO_BATCH_WINDOW <= 0:
+        return fetch_video_metadata(video_id)
+    future = Future()
+    INFO_BATCH_QUEUE.put((video_id, future))
+    return future.result(timeout=60)
+
+
+# Helper function to look up and cache a video that missed the /api/info
+# cache, through yt-dlp first when USE_YTDLP_META is set
+def resolve_video_info(video_id):
+    video_info = None
+    if USE_YTDLP_META:
+        try:
+            video_info = extract_video_metadata(video_id)
+        except Exception as e:
+            logger.warning("yt-dlp metadata failed, using the YouTube API: %s", e)
+    if video_info is None:
+        video_info = lookup_video_metadata(video_id)
+    if video_info is not None:
+        with INFO_CACHE_LOCK:
+            INFO_CACHE[video_id] = video_info
+    return video_info
+
+
+# Helper function to resolve a cache miss once however many requests ask for
+# the same video at the same time: the first does the lookup and the rest
+# wait for its result (or its exception)
+def resolve_video_info_once(video_id):
+    with INFO_INFLIGHT_LOCK:
+        future = INFO_INFLIGHT.get(video_id)
+        leader = future is None
+        if leader:
+            future = INFO_INFLIGHT[video_id] = Future()
+    if leader:
+        try:
+            future.set_result(resolve_video_info(video_id))
+        except Exception as e:
+            future.set_exception(e)
+        finally:
+            with INFO_INFLIGHT_LOCK:
+                del INFO_INFLIGHT[video_id]
+    return future.result(timeout=60)
+
+
+# Helper function to fetch one micro-batch and hand each waiting lookup its
+# result. A lone video goes through fetch_video_metadata so that it can still
+# be revalidated with its ETag.
+def resolve_video_metadata_batch(pending):
+    video_ids = list(dict.fromkeys(video_id for video_id, _ in pending))
+    try:
+        if len(video_ids) == 1:
+            fetched = {video_ids[0]: fetch_video_metadata(video_ids[0])}
+        else:
+            fetched = fetch_videos_metadata(video_ids)
+    except Exception as e:
+        for _, future in pending:
+            future.set_exception(e)
+        return
+    for video_id, future in pending:
+        future.set_result(fetched.get(video_id))
+
+
+# Background micro-batcher for /api/info. Each batch is fetched on the
+# metadata pool so the next one can start collecting straight away.
+def batch_video_metadata_forever():
+    while True:
+        pending = [INFO_BATCH_QUEUE.get()]
+        video_ids = {pending[0][0]}
+        deadline = time.monotonic() + INFO_BATCH_WINDOW
+        while len(video_ids) < YOUTUBE_API_BATCH_SIZE:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                pending.append(INFO_BATCH_QUEUE.get(timeout=timeout))
+            except queue.Empty:
+                break
+            video_ids.add(pending[-1][0])
+        METADATA_POOL.submit(resolve_video_metadata_batch, pending)
+
+
+# Helper function to turn a failed YouTube Data API call into an error response
+def youtube_api_error_response(e):
+    if isinstance(e, ApiKeysExhausted):
+        logger.error(str(e))
+        return jsonify({"error": "YouTube API quota exceeded or API key invalid"}), 429
+    if isinstance(e, requests.HTTPError):
+        if e.response.status_code == 403:
+            logger.error("YouTube API quota exceeded or API key invalid: %s", e.response.text)
+            return (
+                jsonify({"error": "YouTube API quota exceeded or API key invalid"}),
+                429,
+            )
+        # The request URL carries the API key, so don't echo str(e) back
+        logger.error("YouTube API error: %s %s", e.response.status_code, e.response.text)
+        return (
+            jsonify({"error": f"YouTube API error: HTTP {e.response.status_code}"}),
+            500,
+        )
+    logger.error("YouTube API request failed: %s", e)
+    return jsonify({"error": "Could not reach the YouTube API"}), 500
+
+
+# Background janitor that removes stale files from the downloads folder:
+# downloads handed to a proxy (which can't be deleted inline), finished jobs
+# and anything left behind by a crashed worker. The cookie file is kept. It
+# also keeps the audio cache within its size limit.
+def clean_downloads_forever():
+    while True:
+        time.sleep(DOWNLOAD_CLEANUP_INTERVAL)
+        cutoff = time.time() - DOWNLOAD_MAX_AGE
+        try:
+            with os.scandir(app.config["DOWNLOAD_FOLDER"]) as entries:
+                for entry in entries:
+                    if entry.path == COOKIE_FILE or not entry.is_file():
+                        continue
+                    try:
+                        if entry.stat().st_mtime < cutoff:
+                            os.unlink(entry.path)
+                            logger.info("Removed stale download: %s", entry.path)
+                    except OSError:
+                        pass  # Already removed by another worker
+        except Exception as e:
+            logger.warning("Download cleanup failed: %s", e)
+        if AUDIO_CACHE_MAX_BYTES > 0:
+            try:
+                evict_audio_cache()
+            except Exception as e:
+                logger.warning("Audio cache eviction failed: %s", e)
+
+
+# Matches the ISO 8601 durations the Data API returns, e.g. PT4M13S, P1DT2H
+DURATION_RE = re.compile(
+    r"P(?:(\d+)W)?(?:(\d+)D)?(?:T(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?)?"
+)
 
 
 # Helper function to convert ISO 8601 duration to seconds
+@functools.lru_cache(maxsize=10000)
 def convert_duration(duration):
-    return int(isodate.parse_duration(duration).total_seconds())
+    match = DURATION_RE.fullmatch(duration)
+    if not match:
+        raise ValueError(f"Invalid duration: {duration}")
+    weeks, days, hours, minutes, seconds = (int(n) if n else 0 for n in match.groups())
+    return (((weeks * 7 + days) * 24 + hours) * 60 + minutes) * 60 + seconds
 
 
+# Helper function to get FFmpeg's version line, or None and the error if it
+# can't be run. FFmpeg doesn't come or go while the app runs, so it is
+# checked once per worker, on first use rather than at boot.
+@functools.lru_cache(maxsize=None)
+def probe_ffmpeg():
+    try:
+        result = subprocess.run(
+            ["ffmpeg", "-version"], capture_output=True, text=True, check=True
+        )
+        return result.stdout.split("\n")[0], None
+    except (subprocess.SubprocessError, FileNotFoundError) as e:
+        logger.warning("FFmpeg is not available: %s", e)
+        return None, str(e)
+
+# Start the downloads janitor
+threading.Thread(
+    target=clean_downloads_forever, name="downloads-janitor", daemon=True
+).start()
+
+# Start the /api/info micro-batcher
+if INFO_BATCH_WINDOW > 0:
+    threading.Thread(
+        target=batch_video_metadata_forever, name="info-batcher", daemon=True
+    ).start()
+
+# Load yt-dlp's YouTube extractor in the background at boot, so the first
+# in-process yt-dlp call (a USE_YTDLP_META /api/info lookup or a redirect=1
+# download) doesn't pay for the import
+threading.Thread(
+    target=lambda: yt_dlp.YoutubeDL({"quiet": True}).get_info_extractor("Youtube"),
+    name="yt-dlp-prewarm",
+    daemon=True,
+).start()
+
 # Swagger configuration
 SWAGGER_URL = "/api/docs"  # URL for exposing Swagger UI
 API_URL = "/static/swagger.json"  # Our API url
@@ -124,10 +1265,7 @@ swaggerui_blueprint = get_swaggerui_blueprint(
 # Register blueprint at URL
 app.register_blueprint(swaggerui_blueprint, url_prefix=SWAGGER_URL)
 
-# Create a static folder if it doesn't exist
-os.makedirs("static", exist_ok=True)
-
-# Create a swagger.json file with API documentation
+# Swagger API documentation
 swagger_json = {
     "swagger": "2.0",
     "info": {
@@ -158,10 +1296,76 @@ swagger_json = {
                 },
             }
         },
+        "/info/batch": {
+            "post": {
+                "summary": "Get information about several YouTube videos",
+                "description": "Returns information about each URL in input order, looking up 50 videos per YouTube API call",
+                "consumes": ["application/json"],
+                "parameters": [
+                    {
+                        "name": "body",
+                        "in": "body",
+                        "required": True,
+                        "schema": {
+                            "type": "object",
+                            "properties": {
+                                "urls": {
+                                    "type": "array",
+                                    "items": {"type": "string"},
+                                    "description": "YouTube video URLs",
+                                }
+                            },
+                        },
+                    }
+                ],
+                "responses": {
+                    "200": {"description": "Video information for each URL"},
+                    "400": {"description": "Bad request"},
+                    "429": {"description": "YouTube API quota exceeded"},
+                    "500": {"description": "Internal server error"},
+                },
+            }
+        },
+        "/info/cache/{video_id}": {
+            "delete": {
+                "summary": "Invalidate cached video information",
+                "description": "Removes a video's cached /info result so the next request fetches it again",
+                "parameters": [
+                    {
+                        "name": "video_id",
+                        "in": "path",
+                        "description": "YouTube video ID",
+                        "required": True,
+                        "type": "string",
+                    }
+                ],
+                "responses": {
+                    "200": {"description": "Whether an entry was removed"},
+                },
+            }
+        },
+        "/cache-stats": {
+            "get": {
+                "summary": "Check video information cache statistics",
+                "description": "Returns size, hit and miss counts of the /info cache, and how many misses the YouTube API answered with 304 Not Modified",
+                "responses": {
+                    "200": {"description": "Cache statistics"},
+                },
+            }
+        },
+        "/cache/clear": {
+            "post": {
+                "summary": "Clear the video information cache",
+                "description": "Drops every cached /info result",
+                "responses": {
+                    "200": {"description": "Number of cleared entries"},
+                },
+            }
+        },
         "/download/audio": {
             "get": {
                 "summary": "Download YouTube audio",
-                "description": "Downloads audio from a YouTube video as MP3",
+                "description": "Downloads audio from a YouTube video as MP3, or in its original format. Repeat downloads are served from a server-side cache.",
                 "parameters": [
                     {
                         "name": "url",
@@ -169,13 +1373,108 @@ swagger_json = {
                         "description": "YouTube video URL",
                         "required": True,
                         "type": "string",
-                    }
+                    },
+                    {
+                        "name": "format",
+                        "in": "query",
+                        "description": "mp3 (transcoded) or native (original Opus/AAC stream, no transcode). Without it, clients that only accept audio/webm or audio/mp4 get the native stream in that container",
+                        "required": False,
+                        "type": "string",
+                        "enum": ["mp3", "native"],
+                        "default": "mp3",
+                    },
+                    {
+                        "name": "stream",
+                        "in": "query",
+                        "description": "Set to 1 to stream the audio as it is produced (no Content-Length, ETag or Range support)",
+                        "required": False,
+                        "type": "string",
+                        "enum": ["0", "1"],
+                        "default": "0",
+                    },
+                    {
+                        "name": "redirect",
+                        "in": "query",
+                        "description": "Set to 1 to be redirected to YouTube's CDN URL for the native audio stream instead of downloading through the API",
+                        "required": False,
+                        "type": "string",
+                        "enum": ["0", "1"],
+                        "default": "0",
+                    },
                 ],
                 "responses": {
                     "200": {"description": "Audio file"},
+                    "206": {"description": "Requested byte range of the audio file"},
+                    "302": {"description": "Redirect to the audio stream on YouTube's CDN (redirect=1)"},
+                    "304": {"description": "Not modified (If-None-Match matched the ETag)"},
                     "400": {"description": "Bad request"},
+                    "416": {"description": "Requested range not satisfiable"},
                     "500": {"description": "Internal server error"},
                 },
+            },
+            "post": {
+                "summary": "Start a background audio download",
+                "description": "Queues the download and returns a job ID to poll; takes the same url and format parameters as GET",
+                "parameters": [
+                    {
+                        "name": "url",
+                        "in": "query",
+                        "description": "YouTube video URL",
+                        "required": True,
+                        "type": "string",
+                    },
+                    {
+                        "name": "format",
+                        "in": "query",
+                        "description": "mp3 (transcoded) or native (original Opus/AAC stream, no transcode). Without it, clients that only accept audio/webm or audio/mp4 get the native stream in that container",
+                        "required": False,
+                        "type": "string",
+                        "enum": ["mp3", "native"],
+                        "default": "mp3",
+                    },
+                ],
+                "responses": {
+                    "202": {"description": "Job accepted"},
+                    "400": {"description": "Bad request"},
+                },
+            },
+        },
+        "/download/audio/{job_id}/status": {
+            "get": {
+                "summary": "Check a background audio download",
+                "description": "Returns running (with bytes written so far), done or error",
+                "parameters": [
+                    {
+                        "name": "job_id",
+                        "in": "path",
+                        "required": True,
+                        "type": "string",
+                    }
+                ],
+                "responses": {
+                    "200": {"description": "Job status"},
+                    "404": {"description": "Job not found"},
+                },
+            }
+        },
+        "/download/audio/{job_id}": {
+            "get": {
+                "summary": "Fetch the audio of a background download",
+                "parameters": [
+                    {
+                        "name": "job_id",
+                        "in": "path",
+                        "required": True,
+                        "type": "string",
+                    }
+                ],
+                "responses": {
+                    "200": {"description": "Audio file"},
+                    "206": {"description": "Requested byte range of the audio file"},
+                    "404": {"description": "Job not found"},
+                    "409": {"description": "Download not finished yet"},
+                    "500": {"description": "Download failed"},
+                },
             }
         },
         "/check-ffmpeg": {
@@ -210,11 +1509,13 @@ swagger_json = {
     },
 }
 
-# Write the swagger.json file
-with open("static/swagger.json", "w") as f:
-    import json
+# Serialize the documentation once; it is served from memory
+SWAGGER_BYTES = orjson.dumps(swagger_json)
+
 
-    json.dump(swagger_json, f)
+@app.route(API_URL)
+def swagger_spec():
+    return Response(SWAGGER_BYTES, mimetype="application/json")
 
 
 @app.route("/")
@@ -229,206 +1530,420 @@ def get_video_info():
     if not url:
         return jsonify({"error": "URL parameter is required"}), 400
 
+    # Reject anything that isn't a YouTube video URL before calling the API
     try:
-        # Extract video ID from URL
         video_id = extract_video_id(url)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        # Serve repeat lookups from the cache
+        video_info = get_cached_video_info(video_id)
+        if video_info is None:
+            video_info = resolve_video_info_once(video_id)
+            if video_info is None:
+                return jsonify({"error": "Video not found"}), 404
 
-        # Get a random API key
-        api_key = get_random_api_key()
+        # Let clients and proxies cache the result for as long as we do, and
+        # answer If-None-Match revalidations with a 304
+        response = jsonify(video_info)
+        response.set_etag(hashlib.blake2b(response.get_data(), digest_size=12).hexdigest())
+        response.headers["Cache-Control"] = (
+            f"public, max-age={int(INFO_CACHE.ttl)}, stale-while-revalidate=3600"
+        )
+        response.vary.add("Accept-Encoding")
+        return response.make_conditional(request)
 
-        # Create YouTube API client
-        youtube = build("youtube", "v3", developerKey=api_key)
+    except (requests.RequestException, ApiKeysExhausted) as e:
+        return youtube_api_error_response(e)
+    except Exception as e:
+        logger.error("Error getting video info: %s", e)
+        return jsonify({"error": str(e)}), 500
 
-        # Get video details
-        video_response = (
-            youtube.videos()
-            .list(part="snippet,contentDetails,statistics", id=video_id)
-            .execute()
+
+@app.route("/api/info/batch", methods=["POST"])
+def get_video_info_batch():
+    """Endpoint to get the info of several videos, 50 per Data API call"""
+    payload = request.get_json(silent=True)
+    urls = payload.get("urls") if isinstance(payload, dict) else None
+
+    if not isinstance(urls, list) or not urls:
+        return jsonify({"error": "urls must be a non-empty list"}), 400
+    if len(urls) > INFO_BATCH_MAX_URLS:
+        return (
+            jsonify({"error": f"At most {INFO_BATCH_MAX_URLS} URLs per request"}),
+            400,
         )
 
-        if not video_response["items"]:
-            return jsonify({"error": "Video not found"}), 404
+    try:
+        # Resolve what we can from the cache and collect the rest
+        video_ids = []
+        video_infos = {}
+        for url in urls:
+            try:
+                video_id = extract_video_id(url) if isinstance(url, str) else None
+            except ValueError:
+                video_id = None
+            video_ids.append(video_id)
+            if video_id and video_id not in video_infos:
+                video_infos[video_id] = get_cached_video_info(video_id)
 
-        video = video_response["items"][0]
+        missing = [video_id for video_id, info in video_infos.items() if info is None]
+        chunks = [
+            missing[i:i + YOUTUBE_API_BATCH_SIZE]
+            for i in range(0, len(missing), YOUTUBE_API_BATCH_SIZE)
+        ]
+        for fetched in METADATA_POOL.map(fetch_videos_metadata, chunks):
+            video_infos.update(fetched)
+            with INFO_CACHE_LOCK:
+                INFO_CACHE.update(fetched)
 
-        # Format response
-        video_info = {
-            "title": video["snippet"]["title"],
-            "author": video["snippet"]["channelTitle"],
-            "description": video["snippet"]["description"],
-            "thumbnail_url": video["snippet"]["thumbnails"]["high"]["url"],
-            "views": int(video["statistics"].get("viewCount", 0)),
-            "length_seconds": convert_duration(video["contentDetails"]["duration"]),
-        }
+        # Answer in input order
+        results = []
+        for url, video_id in zip(urls, video_ids):
+            if video_id is None:
+                results.append({"url": url, "error": "Invalid YouTube URL"})
+            elif video_infos.get(video_id) is None:
+                results.append({"url": url, "video_id": video_id, "error": "Video not found"})
+            else:
+                results.append({"url": url, "video_id": video_id, **video_infos[video_id]})
 
-        return jsonify(video_info)
+        return jsonify({"results": results})
 
-    except HttpError as e:
-        if e.resp.status == 403:
-            logger.error(f"YouTube API quota exceeded or API key invalid: {str(e)}")
-            return (
-                jsonify({"error": "YouTube API quota exceeded or API key invalid"}),
-                429,
-            )
-        else:
-            logger.error(f"YouTube API error: {str(e)}")
-            return jsonify({"error": str(e)}), 500
+    except (requests.RequestException, ApiKeysExhausted) as e:
+        return youtube_api_error_response(e)
     except Exception as e:
-        logger.error(f"Error getting video info: {str(e)}")
+        logger.error("Error getting batch video info: %s", e)
         return jsonify({"error": str(e)}), 500
 
 
-@app.route("/api/download/audio", methods=["GET"])
-def download_audio():
+@app.route("/api/info/cache/<video_id>", methods=["DELETE"])
+def invalidate_video_info(video_id):
+    """Endpoint to drop a video's cached /api/info result"""
+    with INFO_CACHE_LOCK:
+        removed = INFO_CACHE.pop(video_id, None) is not None
+        INFO_ETAGS.pop(video_id, None)
+    return jsonify({"video_id": video_id, "removed": removed})
+
+
+@app.route("/api/cache-stats")
+def cache_stats():
+    """Endpoint to check how well the /api/info cache is doing"""
+    with INFO_CACHE_LOCK:
+        hits = INFO_CACHE_STATS["hits"]
+        misses = INFO_CACHE_STATS["misses"]
+        revalidated = INFO_CACHE_STATS["revalidated"]
+        size = len(INFO_CACHE)
+    lookups = hits + misses
+    return jsonify(
+        {
+            "size": size,
+            "max_size": INFO_CACHE.maxsize,
+            "ttl_seconds": INFO_CACHE.ttl,
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "revalidated": revalidated,
+        }
+    )
+
+
+@app.route("/api/cache/clear", methods=["POST"])
+def clear_cache():
+    """Endpoint to drop every cached /api/info result"""
+    with INFO_CACHE_LOCK:
+        cleared = len(INFO_CACHE)
+        INFO_CACHE.clear()
+        INFO_ETAGS.clear()
+    return jsonify({"cleared": cleared})
+
+
+# Helper function to read the url and format arguments of a download request.
+# Returns the canonical video URL and the key of AUDIO_FORMATS to download
+# in, or an error response.
+def parse_download_args():
     url = request.args.get("url")
 
     if not url:
-        return jsonify({"error": "URL parameter is required"}), 400
+        return None, None, (jsonify({"error": "URL parameter is required"}), 400)
 
+    # Reject anything that isn't a YouTube video URL before spawning yt-dlp.
+    # yt-dlp is given the canonical watch URL for the ID, so what it fetches
+    # always matches the ID the audio is cached under.
     try:
-        # Generate a unique filename for both the temporary video and final mp3
-        unique_id = uuid.uuid4().hex
-        temp_video_path = os.path.join(app.config["DOWNLOAD_FOLDER"], f"{unique_id}.%(ext)s")
-        final_mp3_path = os.path.join(app.config["DOWNLOAD_FOLDER"], f"{unique_id}.mp3")
-        
-        # Get a random user agent
-        user_agent = get_random_user_agent()
-        
-        # First, just get the video info to get the title
-        info_opts = {
-            "quiet": True,
-            "no_warnings": True,
-            "user_agent": user_agent,
-            "referer": "https://www.youtube.com/",
-            "nocheckcertificate": True,
-            "geo_bypass": True,
-            "skip_download": True,  # Don't download, just get info
-        }
-        
-        # Add cookies if available
-        if os.path.exists(COOKIE_FILE):
-            info_opts["cookiefile"] = COOKIE_FILE
-        
-        video_title = "audio"  # Default title
+        video_id = extract_video_id(url)
+    except ValueError as e:
+        return None, None, (jsonify({"error": str(e)}), 400)
+    url = f"https://www.youtube.com/watch?v={video_id}"
+
+    # "mp3" transcodes with FFmpeg; "native" serves the original Opus/AAC
+    # stream as-is, which skips the transcode entirely. Without the parameter,
+    # clients that only accept WebM or MP4 audio get the native stream in
+    # that container, so the response varies with the Accept header.
+    audio_format = request.args.get("format")
+    if audio_format is None:
+        accepted = request.accept_mimetypes.best_match(
+            ["audio/mpeg", "audio/webm", "audio/mp4"]
+        )
+        audio_format = {"audio/webm": "webm", "audio/mp4": "m4a"}.get(accepted, "mp3")
+
+        @after_this_request
+        def vary_on_accept(response):
+            response.vary.add("Accept")
+            return response
+
+    elif audio_format not in ("mp3", "native"):
+        return None, None, (jsonify({"error": "format must be 'mp3' or 'native'"}), 400)
+    return url, audio_format, None
+
+
+@app.route("/api/download/audio", methods=["GET"])
+def download_audio():
+    url, audio_format, error = parse_download_args()
+    if error:
+        return error
+
+    try:
+        # With redirect=1 the client is sent to YouTube's CDN for the native
+        # stream, which costs no server bandwidth or transcoding. The URL
+        # expires after a few hours and may be tied to the server's IP.
+        if request.args.get("redirect") == "1":
+            if request.args.get("format") == "mp3":
+                return jsonify({"error": "redirect=1 only supports format=native"}), 400
+            response = redirect(
+                extract_audio_url(
+                    extract_video_id(url),
+                    "native" if audio_format == "mp3" else audio_format,
+                ),
+                code=302,
+            )
+            response.headers["Cache-Control"] = "private, max-age=300"
+            return response
+
+        # Serve repeat downloads of a video from the audio cache
+        if AUDIO_CACHE_MAX_BYTES > 0:
+            video_id = extract_video_id(url)
+            entry = get_cached_audio(video_id, audio_format)
+            if entry is not None:
+                return send_cached_audio(entry)
+
+        # With stream=1 the audio is sent as it is produced instead of once
+        # the whole file is ready. There's no Content-Length or ETag, and a
+        # failure part way through can only cut the response short.
+        if request.args.get("stream") == "1":
+            done = reserve_download_worker()
+            try:
+                processes, title_pipe = start_audio_pipeline(url, audio_format)
+            except Exception:
+                done.set()
+                raise
+            try:
+                first_chunk = processes[-1].stdout.read1(STREAM_CHUNK_SIZE)
+                if not first_chunk:
+                    finish_audio_pipeline(processes)
+                    raise AudioPipelineError(
+                        "MP3 file not created"
+                        if audio_format == "mp3"
+                        else "Audio file not created"
+                    )
+            except AudioPipelineError as e:
+                kill_audio_pipeline(processes)
+                title_pipe.close()
+                done.set()
+                return jsonify({"error": str(e)}), 500
+            except Exception:
+                kill_audio_pipeline(processes)
+                title_pipe.close()
+                done.set()
+                raise
+
+            if audio_format == "mp3":
+                extension, mimetype = "mp3", "audio/mpeg"
+            else:
+                extension, mimetype = detect_audio_format(first_chunk)
+
+            download_name = f"{read_video_title(title_pipe)}.{extension}"
+            response = Response(
+                stream_with_context(stream_audio_pipeline(processes, first_chunk)),
+                mimetype=mimetype,
+                headers={"Content-Disposition": attachment_disposition(download_name)},
+            )
+            # Closing the response ends the pipeline even if the stream was
+            # never started, and hands the pool worker back
+            response.call_on_close(lambda: kill_audio_pipeline(processes))
+            response.call_on_close(done.set)
+            return response
+
+        # With the cache on, the audio is downloaded straight into it
+        if AUDIO_CACHE_MAX_BYTES > 0:
+            try:
+                entry = DOWNLOAD_POOL.submit(
+                    cache_audio_file, url, video_id, audio_format
+                ).result()
+            except AudioPipelineError as e:
+                return jsonify({"error": str(e)}), 500
+            return send_cached_audio(entry)
+
+        # Behind a proxy the audio is written to the downloads folder so the
+        # proxy can send it itself; otherwise it is collected in a spooled
+        # file that only touches the disk once it grows large
+        hand_off = USE_XACCEL or app.config["USE_X_SENDFILE"]
+        if hand_off:
+            filename = f"{os.getpid()}-{next(DOWNLOAD_COUNTER)}"
+            output_path = os.path.abspath(
+                os.path.join(app.config["DOWNLOAD_FOLDER"], filename)
+            )
+            output = open(output_path, "w+b", buffering=1024 * 1024)
+        else:
+            output_path = None
+            output = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+
+        # Run the pipeline on the shared download pool, which bounds how many
+        # downloads and transcodes run at once
         try:
-            with yt_dlp.YoutubeDL(info_opts) as ydl:
-                info_dict = ydl.extract_info(url, download=False)
-                video_title = info_dict.get('title', 'audio')
-                logger.info(f"Video title: {video_title}")
+            size, etag, video_title = DOWNLOAD_POOL.submit(
+                download_audio_file, url, output, audio_format
+            ).result()
         except Exception as e:
-            logger.warning(f"Could not get video info: {str(e)}")
-        
-        # Now download the video using youtube-dl command line
-        # This is more reliable than using the Python API for problematic videos
-        import subprocess
-        
-        logger.info("Downloading video using yt-dlp command line...")
-        download_cmd = [
-            "yt-dlp",
-            "--no-warnings",
-            "--geo-bypass",
-            "--no-check-certificate",
-            "-f", "best",  # Use 'best' format which is usually available
-            "-o", temp_video_path,
-            url
-        ]
-        
-        # Add cookies if available
-        if os.path.exists(COOKIE_FILE):
-            download_cmd.extend(["--cookies", COOKIE_FILE])
-        
-        # Run the download command
-        try:
-            result = subprocess.run(
-                download_cmd, 
-                check=True, 
-                capture_output=True, 
-                text=True
+            output.close()
+            if output_path and os.path.exists(output_path):
+                os.remove(output_path)
+            if isinstance(e, AudioPipelineError):
+                return jsonify({"error": str(e)}), 500
+            raise
+
+        extension, mimetype = audio_file_type(output, audio_format)
+
+        download_name = f"{video_title}.{extension}"
+
+        if hand_off:
+            output.close()
+            os.replace(output_path, f"{output_path}.{extension}")
+
+        # send_file only sets the X-Sendfile header for a path; the proxy
+        # reads the file and the janitor removes it later
+        if app.config["USE_X_SENDFILE"]:
+            return send_file(
+                f"{output_path}.{extension}",
+                mimetype=mimetype,
+                as_attachment=True,
+                download_name=download_name,
+                etag=etag,
             )
-            logger.info("Download completed successfully")
-            logger.debug(result.stdout)
-        except subprocess.CalledProcessError as e:
-            logger.error(f"yt-dlp download failed: {str(e)}")
-            logger.error(f"Command output: {e.stdout}")
-            logger.error(f"Command error: {e.stderr}")
-            return jsonify({"error": f"Video download failed: {e.stderr}"}), 500
-        
-        # Find the downloaded file
-        downloaded_file = None
-        for file in os.listdir(app.config["DOWNLOAD_FOLDER"]):
-            if file.startswith(unique_id) and file != f"{unique_id}.mp3":
-                downloaded_file = os.path.join(app.config["DOWNLOAD_FOLDER"], file)
-                break
-        
-        if not downloaded_file:
-            logger.error("Could not find downloaded file")
-            return jsonify({"error": "Could not find downloaded file"}), 500
-        
-        logger.info(f"Downloaded file: {downloaded_file}")
-        
-        # Convert to MP3 using FFmpeg
-        try:
-            logger.info(f"Converting {downloaded_file} to {final_mp3_path}")
-            subprocess.run([
-                "ffmpeg", 
-                "-i", downloaded_file, 
-                "-vn",  # No video
-                "-ar", "44100",  # Audio sample rate
-                "-ac", "2",      # Stereo
-                "-b:a", "192k",  # Bitrate
-                "-f", "mp3",     # Format
-                final_mp3_path
-            ], check=True, capture_output=True)
-            
-            # Delete the original video file
-            try:
-                os.remove(downloaded_file)
-                logger.info(f"Deleted original video file: {downloaded_file}")
-            except Exception as e:
-                logger.warning(f"Could not delete original video file: {str(e)}")
-            
-        except subprocess.CalledProcessError as e:
-            logger.error(f"FFmpeg conversion failed: {str(e)}")
-            logger.error(f"FFmpeg stderr: {e.stderr.decode() if hasattr(e.stderr, 'decode') else e.stderr}")
-            return jsonify({"error": f"Audio conversion failed: {str(e)}"}), 500
-        
-        # Check if the MP3 file exists
-        if not os.path.exists(final_mp3_path):
-            logger.error(f"MP3 file not found at: {final_mp3_path}")
-            return jsonify({"error": "MP3 file not created"}), 500
-        
-        # Return the MP3 file
-        return send_file(
-            final_mp3_path,
+
+        if USE_XACCEL:
+            return Response(
+                mimetype=mimetype,
+                headers={
+                    "X-Accel-Redirect": f"{XACCEL_PREFIX}/{filename}.{extension}",
+                    "Content-Disposition": attachment_disposition(download_name),
+                },
+            )
+
+        # Return the audio; the file wrapper closes the spool once it is sent
+        output.seek(0)
+        response = send_file(
+            output,
+            mimetype=mimetype,
             as_attachment=True,
-            download_name=f"{video_title}.mp3",
+            download_name=download_name,
+            conditional=False,
+            etag=etag,
         )
+        # Werkzeug can't size a spooled file itself, so pass the length in to
+        # answer If-None-Match with a 304 and Range / If-Range with a 206.
+        # The ETag is a digest of the audio, so a resume only gets a partial
+        # response if the re-download produced the same bytes.
+        response.content_length = size
+        response.headers["Accept-Ranges"] = "bytes"
+        # Send in STREAM_CHUNK_SIZE blocks rather than 8 KiB ones. A spool
+        # that stayed in memory gets a plain wrapper, since gunicorn probing
+        # it for a fileno to sendfile() would roll it over to disk; one that
+        # already spilled keeps the server's wrapper so it can use sendfile.
+        if size <= SPOOL_MAX_SIZE:
+            response.response = FileWrapper(output, STREAM_CHUNK_SIZE)
+        else:
+            response.response = wrap_file(request.environ, output, STREAM_CHUNK_SIZE)
+        try:
+            return response.make_conditional(
+                request.environ, accept_ranges=True, complete_length=size
+            )
+        except RequestedRangeNotSatisfiable as e:
+            response.close()
+            return e
 
     except Exception as e:
-        logger.error(f"Error downloading audio: {str(e)}")
+        logger.error("Error downloading audio: %s", e)
         return jsonify({"error": str(e)}), 500
 
-@app.route("/api/check-ffmpeg")
-def check_ffmpeg():
-    try:
-        # Run ffmpeg -version command
-        import subprocess
+@app.route("/api/download/audio", methods=["POST"])
+def enqueue_download():
+    """Endpoint to start downloading audio in the background"""
+    url, audio_format, error = parse_download_args()
+    if error:
+        return error
 
-        result = subprocess.run(
-            ["ffmpeg", "-version"], capture_output=True, text=True, check=True
-        )
-        return jsonify(
+    # Create the .part file up front so the job is visible right away
+    job_id = secrets.token_hex(16)
+    open(job_path(job_id, ".part"), "wb").close()
+    DOWNLOAD_POOL.submit(run_download_job, job_id, url, audio_format)
+
+    return (
+        jsonify(
             {
-                "status": "success",
-                "ffmpeg_available": True,
-                "version_info": result.stdout.split("\n")[0],
+                "job_id": job_id,
+                "status_url": f"/api/download/audio/{job_id}/status",
+                "download_url": f"/api/download/audio/{job_id}",
             }
-        )
-    except (subprocess.SubprocessError, FileNotFoundError) as e:
+        ),
+        202,
+    )
+
+
+@app.route("/api/download/audio/<job_id>/status")
+def download_job_status(job_id):
+    """Endpoint to check on a background download"""
+    status = read_job_status(job_id) if JOB_ID_RE.fullmatch(job_id) else None
+    if status is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify({"job_id": job_id, **status})
+
+
+@app.route("/api/download/audio/<job_id>")
+def download_job_file(job_id):
+    """Endpoint to fetch the audio of a finished background download"""
+    status = read_job_status(job_id) if JOB_ID_RE.fullmatch(job_id) else None
+    if status is None:
+        return jsonify({"error": "Job not found"}), 404
+    if status["status"] == "error":
+        return jsonify({"error": status["error"]}), 500
+    if status["status"] != "done":
+        return jsonify({"error": "Download not finished yet", **status}), 409
+
+    return send_audio_file(
+        job_path(job_id, f".{status['extension']}"),
+        f"{XACCEL_PREFIX}/job-{job_id}.{status['extension']}",
+        status["mimetype"],
+        f"{status['title']}.{status['extension']}",
+        status["etag"],
+    )
+
+
+@app.route("/api/check-ffmpeg")
+def check_ffmpeg():
+    ffmpeg_version, ffmpeg_error = probe_ffmpeg()
+    if ffmpeg_version is None:
         return (
-            jsonify({"status": "error", "ffmpeg_available": False, "error": str(e)}),
+            jsonify({"status": "error", "ffmpeg_available": False, "error": ffmpeg_error}),
             500,
         )
+    return jsonify(
+        {
+            "status": "success",
+            "ffmpeg_available": True,
+            "version_info": ffmpeg_version,
+        }
+    )
 
 
 @app.route("/api/api-keys")
@@ -438,6 +1953,9 @@ def api_keys_status():
         {
             "api_keys_count": len(YOUTUBE_API_KEYS),
             "api_keys_available": len(YOUTUBE_API_KEYS) > 0,
+            "api_keys_cooling_down": sum(
+                1 for until in API_KEY_COOLDOWNS if until > time.time()
+            ),
             "api_keys_source": (
                 "environment"
                 if os.environ.get("YOUTUBE_API_KEY_1")
@@ -453,11 +1971,17 @@ def check_cookies():
     """Endpoint to check if YouTube cookies are available"""
     if os.path.exists(COOKIE_FILE):
         try:
-            with open(COOKIE_FILE, "r") as f:
-                first_line = f.readline().strip()
-                line_count = (
-                    sum(1 for _ in f) + 1
-                )  # +1 for the first line we already read
+            # Count newlines in 1 MiB binary blocks instead of decoding and
+            # iterating line by line; cookie files grow with expired entries
+            with open(COOKIE_FILE, "rb") as f:
+                first_line = f.readline().decode("utf-8", "replace").strip()
+                line_count = 1  # the first line we already read
+                last = b""
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    line_count += block.count(b"\n")
+                    last = block
+                if last and not last.endswith(b"\n"):
+                    line_count += 1
 
             return jsonify(
                 {
@@ -515,7 +2039,7 @@ def handle_bad_request(e):
 
 @app.errorhandler(Exception)
 def handle_exception(e):
-    logger.error(f"Unhandled exception: {str(e)}")
+    logger.error("Unhandled exception: %s", e)
     return jsonify({"error": "Internal server error"}), 500
 
 
@@ -525,7 +2049,8 @@ def favicon():
 
 
 if __name__ == "__main__":
+    # Local development only; in production run under Gunicorn with
+    # gunicorn -c gunicorn_conf.py app:app
     # Use environment variable for port with a default of 5000
     port = int(os.environ.get("PORT", 5000))
-    # In production, set debug to False
     app.run(host="0.0.0.0", port=port, debug=False)
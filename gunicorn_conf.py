@@ -0,0 +1,21 @@
+import os
+
+# Gunicorn configuration for production, used via:
+#   gunicorn -c gunicorn_conf.py app:app
+# Downloads spend most of their time waiting on yt-dlp and FFmpeg, so each
+# worker runs a pool of threads to keep serving other requests meanwhile.
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+# Every worker has its own download pool, caches and background threads, so
+# a few workers go a long way; raise WEB_CONCURRENCY on larger hosts
+workers = int(os.environ.get("WEB_CONCURRENCY", "2"))
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "gthread")
+threads = int(os.environ.get("GUNICORN_THREADS", "32"))
+
+# With GUNICORN_WORKER_CLASS=gevent (pip install gevent) each worker
+# multiplexes this many connections on greenlets instead of threads; gunicorn
+# monkey-patches sockets, threads and subprocess before loading the app
+worker_connections = int(os.environ.get("GUNICORN_WORKER_CONNECTIONS", "1000"))
+
+# A long video can take minutes to download and convert
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", "600"))